@@ -1,16 +1,16 @@
 # Plot polarized emissivity as shown in Figure 8
 import argparse
 import os
+import warnings
 
 import numpy as np
 import matplotlib
 import matplotlib.pyplot as plt
 from matplotlib.ticker import EngFormatter, StrMethodFormatter
-from mpl_toolkits.mplot3d import Axes3D
 
 import pandas as pd
-import geopandas as gpd
-import fiona
+
+from ovda_io import read_gpkg, unique_points, use_batch_backend, interactive_backend
 
 def cli():
     parser = argparse.ArgumentParser(
@@ -68,27 +68,52 @@ def cli():
         default="k",
         help="Plot color",
     )
+    parser.add_argument(
+        "-datashadeMin",
+        type=int,
+        default=100000,
+        help="Number of points above which the point cloud is aggregated with Datashader",
+    )
 
     
     return parser.parse_args()
 
 
-def main():
-    args = cli()
+# aggregate the points onto a canvas matching the axes size at the output dpi and
+# draw the shaded result as a single image; returns False without drawing anything
+# if the optional datashader package is not installed
+def datashade_points(data, xField, yField, ax, xlim, ylim, color, dpi = 300):
+    try:
+        import datashader as ds
+        import datashader.transfer_functions as tf
+    except ImportError:
+        warnings.warn("datashader is not installed, plotting the deduplicated points instead")
+        return False
 
-    
-    # Read data from gpkg and store in geodataframe
-    layer = fiona.listlayers(args.file)[0]
-    data = gpd.read_file(args.file, layer = layer)
-    
-    # plot the data
-    fig, ax = plt.subplots(1,1)
-    fig.set_size_inches(3.5,3.5)
+    bbox = ax.get_position()
+    width, height = ax.figure.get_size_inches()
+    canvas = ds.Canvas(
+        plot_width = int(dpi * bbox.width * width),
+        plot_height = int(dpi * bbox.height * height),
+        x_range = xlim,
+        y_range = ylim,
+    )
+    agg = canvas.points(data, xField, yField)
+    img = tf.shade(agg, cmap = [matplotlib.colors.to_hex(color)])
+    rgba = img.data.view(np.uint8).reshape(img.shape + (4,))
+    ax.imshow(rgba, extent = [xlim[0], xlim[1], ylim[0], ylim[1]], origin = 'lower', aspect = 'auto', interpolation = 'nearest')
+    return True
 
-    matplotlib.rcParams['font.sans-serif'] = "Arial"
-    matplotlib.rcParams['font.family'] = "sans-serif"
 
-    ax.scatter(data[args.emisField], data[args.prField], color = args.color, s = 5, alpha=0.7)
+# draw emissivity against planetary radius onto ax; data holds the fields read by
+# read_gpkg
+def plot_emissivity(data, args, ax):
+    xlim = (args.xaxis_min, args.xaxis_max)
+    ylim = (args.yaxis_min, args.yaxis_max)
+    shaded = len(data) > args.datashadeMin and datashade_points(data, args.emisField, args.prField, ax, xlim, ylim, args.color)
+    if not shaded:
+        x, y = unique_points(data[args.emisField], data[args.prField], ax, xlim, ylim)
+        ax.plot(x, y, 'o', markersize = np.sqrt(5), color = args.color, alpha=0.7, linestyle = 'None', rasterized = True)
 
     ax.set_xlabel("Emissivity", fontsize = 10)
     ax.set_ylabel("Surface elevation (km)", fontsize = 10)
@@ -98,14 +123,28 @@ def main():
     ax.xaxis.labelpad = 15
     ax.yaxis.labelpad = 15
 
+    ax.grid(visible=True, which='major', axis='both', linewidth=0.5)
 
-    lg = ax.legend(fontsize = 10)
-    for lh in lg.legendHandles: 
-        lh.set_alpha(1)
 
-    plt.grid(visible=True, which='major', axis='both', linewidth=0.5)
-    plt.savefig(args.figFile, format="pdf", bbox_inches='tight')
-    plt.show()
+def main():
+    args = cli()
+
     
+    # Read data from gpkg and store in dataframe
+    data = read_gpkg(args.file, [args.emisField, args.prField])
     
-main()
\ No newline at end of file
+    # plot the data
+    with matplotlib.rc_context({"font.sans-serif": "Arial", "font.family": "sans-serif"}):
+        fig, ax = plt.subplots(1,1)
+        fig.set_size_inches(3.5,3.5)
+
+        plot_emissivity(data, args, ax)
+
+        plt.savefig(args.figFile, format="pdf", dpi=300, bbox_inches='tight')
+        if interactive_backend():
+            plt.show()
+
+
+if __name__ == "__main__":
+    use_batch_backend()
+    main()
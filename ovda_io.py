@@ -0,0 +1,80 @@
+# Shared input, point-reduction and backend helpers for the Ovda plotting scripts
+import os
+import sys
+
+import numpy as np
+import matplotlib
+import pandas as pd
+import pyogrio
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# read attribute fields from the first layer of a gpkg (geometry is not needed) as
+# float32, streaming record batches so only one batch is held at full precision,
+# and cache them as parquet next to the gpkg for later runs; each column set gets
+# its own cache file, and a missing, stale or unreadable cache falls back to the gpkg
+def read_gpkg(file, columns, batch_size = 100_000):
+    cache = "{}.{}.cache.parquet".format(file, "-".join(sorted(columns)))
+    if os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(file):
+        try:
+            return pd.read_parquet(cache, columns = columns).astype(np.float32)
+        except (OSError, pa.ArrowException):
+            pass
+
+    layer = pyogrio.list_layers(file)[0][0]
+    schema = pa.schema([(c, pa.float32()) for c in columns])
+    with pyogrio.open_arrow(file, layer = layer, columns = columns, read_geometry = False, batch_size = batch_size, use_pyarrow = True) as (meta, reader):
+        batches = [batch.select(columns).cast(schema) for batch in reader]
+    table = pa.Table.from_batches(batches, schema = schema)
+
+    # write to a temporary file and move it into place, so an interrupted run never
+    # leaves a truncated cache; failing to write the cache does not fail the read.
+    # The temporary file is created normally so the cache gets the usual umask mode
+    tmp = "{}.{}.tmp".format(cache, os.getpid())
+    try:
+        pq.write_table(table, tmp, compression = "zstd")
+        os.replace(tmp, cache)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return table.to_pandas()
+
+
+# snap points inside the axis limits to a half-pixel grid of the output axes and
+# drop duplicates, so overlapping points are only drawn once
+def unique_points(x, y, ax, xlim, ylim, dpi = 300):
+    x = np.asarray(x, dtype = np.float64)
+    y = np.asarray(y, dtype = np.float64)
+    keep = (x >= xlim[0]) & (x <= xlim[1]) & (y >= ylim[0]) & (y <= ylim[1])
+    x, y = x[keep], y[keep]
+
+    bbox = ax.get_position()
+    width, height = ax.figure.get_size_inches()
+    x_step = (xlim[1] - xlim[0]) / (2 * dpi * bbox.width * width)
+    y_step = (ylim[1] - ylim[0]) / (2 * dpi * bbox.height * height)
+    xi = np.round((x - xlim[0]) / x_step).astype(np.uint64)
+    yi = np.round((y - ylim[0]) / y_step).astype(np.uint64)
+
+    key = np.unique(xi << np.uint64(32) | yi)
+    xi = key >> np.uint64(32)
+    yi = key & np.uint64(0xFFFFFFFF)
+    return xlim[0] + xi * x_step, ylim[0] + yi * y_step
+
+
+# built-in matplotlib backends that only write files and cannot open a window
+NON_INTERACTIVE_BACKENDS = ("agg", "cairo", "pdf", "pgf", "ps", "svg", "template")
+
+
+# when run as a script without MPLBACKEND, use the non-GUI Agg backend on hosts
+# with no display server (macOS and Windows do not need DISPLAY for a window)
+def use_batch_backend():
+    if "MPLBACKEND" in os.environ or sys.platform in ("darwin", "win32"):
+        return
+    if not (os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY")):
+        matplotlib.use("Agg")
+
+
+# whether plt.show() can open a figure window with the active backend
+def interactive_backend():
+    return matplotlib.get_backend().lower() not in NON_INTERACTIVE_BACKENDS
@@ -6,11 +6,10 @@ import numpy as np
 import matplotlib
 import matplotlib.pyplot as plt
 from matplotlib.ticker import EngFormatter, StrMethodFormatter
-from mpl_toolkits.mplot3d import Axes3D
 
 import pandas as pd
-import geopandas as gpd
-import fiona
+
+from ovda_io import read_gpkg, unique_points, use_batch_backend, interactive_backend
 
 def cli():
     parser = argparse.ArgumentParser(
@@ -79,62 +78,76 @@ def cli():
     return parser.parse_args()
 
 
-def main():
-    args = cli()
-
-    
-    # Read data from gpkg and store in geodataframe
-    Hlayer = fiona.listlayers(args.Hfile)[0]
-    Vlayer = fiona.listlayers(args.Vfile)[0]
-    ovda_v = gpd.read_file(args.Vfile, layer = Vlayer)
-    ovda_h = gpd.read_file(args.Hfile, layer = Vlayer)
+# compute one row of mean and std statistics per latitude bin with np.add.reduceat
+# over contiguous runs of bin ids, sorting only the integer ids rather than the
+# frame; rows outside the bin edges (bin 0 and bin nbins from np.digitize) or with
+# a missing emissivity are left out, as pandas groupby skips NaN
+def bin_stats(df, bin_id, args, nbins):
+    binned = (bin_id > 0) & (bin_id < nbins) & np.isfinite(df[args.emisField].to_numpy())
+    order = np.argsort(bin_id[binned], kind = "stable")
+    ids = bin_id[binned][order]
+    starts = np.flatnonzero(np.diff(ids, prepend = -1))
+    counts = np.diff(np.append(starts, len(ids)))
+
+    def seg_mean(field):
+        vals = df[field].to_numpy()[binned][order]
+        return vals, np.add.reduceat(vals, starts, dtype = np.float64) / counts
+
+    emis, mean_emis = seg_mean(args.emisField)
+    dev = emis - np.repeat(mean_emis, counts)
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        std_emis = np.sqrt(np.add.reduceat(dev * dev, starts) / (counts - 1))
+
+    return pd.DataFrame(
+        {
+            "mean_emis": mean_emis,
+            "std_emis": std_emis,
+            "mean_inc": seg_mean(args.incField)[1],
+            "mean_lat": seg_mean(args.latField)[1],
+        },
+        index = ids[starts],
+    )
 
-    # sort geodf by latitude
-    dfh = pd.DataFrame(data = ovda_h).sort_values(args.latField)
-    dfv = pd.DataFrame(data = ovda_v).sort_values(args.latField)
 
-    # get min and max latitude and divide into bins
+# bin H and V emissivity by latitude and draw the points, mean emissivity and one
+# standard deviation band onto ax; dfh and dfv hold the fields read by read_gpkg
+def plot_emissivity(dfh, dfv, args, ax):
+    # restrict V data to the incidence angle range of the H data
     min_thi = dfh[args.incField].min()
     max_thi = dfh[args.incField].max()
-    bins = np.arange(min_thi, max_thi+0.05, args.binSize)
-    dfv = dfv[(dfv[args.incField] >= min_thi) & (dfv[args.incField] <= max_thi)]
+    dfv = dfv.query(f"@min_thi <= `{args.incField}` <= @max_thi")
 
+    # get min and max latitude and divide into bins
+    min_lat = dfh[args.latField].min()
+    max_lat = dfh[args.latField].max()
+    bins = np.arange(min_lat, max_lat + args.binSize, args.binSize)
 
     # compute mean and standard deviation emissivity values binned by latitude
-    dfh["BIN"] = pd.cut(dfh[args.incField], bins, right=True)
-    dfh["MEAN_SURFACE_EMISSIVITY"] = dfh.groupby("BIN")[args.emisField].transform("mean") 
-    dfh["STD_SURFACE_EMISSIVITY"] = dfh.groupby("BIN")[args.emisField].transform("std") 
-    dfh["MEAN_INCIDENCE_ANGLE"] = dfh.groupby("BIN")[args.incField].transform("mean") 
-    dfh["MEAN_RAD_FOOTPRINT_LATITUDE"] = dfh.groupby("BIN")[args.latField].transform("mean") 
-
-    dfv["BIN"] = pd.cut(dfv[args.incField], bins, right=True)
-    dfv["MEAN_SURFACE_EMISSIVITY"] = dfv.groupby("BIN")[args.emisField].transform("mean") 
-    dfv["STD_SURFACE_EMISSIVITY"] = dfv.groupby("BIN")[args.emisField].transform("std") 
-    dfv["MEAN_INCIDENCE_ANGLE"] = dfv.groupby("BIN")[args.incField].transform("mean") 
-    dfv["MEAN_RAD_FOOTPRINT_LATITUDE"] = dfv.groupby("BIN")[args.latField].transform("mean")
-    
-    # plot the data
-    fig, ax = plt.subplots(1,1)
-    fig.set_size_inches(16, 8)
-
-
-    matplotlib.rcParams['font.sans-serif'] = "Arial"
-    matplotlib.rcParams['font.family'] = "sans-serif"
+    bin_id_h = np.digitize(dfh[args.latField].to_numpy(), bins, right=True)
+    bin_id_v = np.digitize(dfv[args.latField].to_numpy(), bins, right=True)
+    stats_h = bin_stats(dfh, bin_id_h, args, len(bins))
+    stats_v = bin_stats(dfv, bin_id_v, args, len(bins))
 
     hcolor = "#ae76a3"
     vcolor = "#90c987"
     hcoloravg = "#882e72"
     vcoloravg = "#4eb27f"
 
-    dfh.plot.scatter(args.latField, args.emisField, ax=ax, s = 10, color = "white", edgecolor = hcolor)
-    dfv.plot.scatter(args.latField, args.emisField, ax=ax, s = 10, color = "white", edgecolor = vcolor)
+    xlim = (args.xaxis_min, args.xaxis_max)
+    ylim = (args.yaxis_min, args.yaxis_max)
+    xh, yh = unique_points(dfh[args.latField], dfh[args.emisField], ax, xlim, ylim)
+    xv, yv = unique_points(dfv[args.latField], dfv[args.emisField], ax, xlim, ylim)
+    ax.plot(xh, yh, 'o', markersize = np.sqrt(10), markerfacecolor = "none", markeredgecolor = hcolor, linestyle = 'None', rasterized = True)
+    ax.plot(xv, yv, 'o', markersize = np.sqrt(10), markerfacecolor = "none", markeredgecolor = vcolor, linestyle = 'None', rasterized = True)
 
-    ax.fill_between(dfh['MEAN_RAD_FOOTPRINT_LATITUDE'], dfh['MEAN_SURFACE_EMISSIVITY'] - dfh['STD_SURFACE_EMISSIVITY'], dfh['MEAN_SURFACE_EMISSIVITY'] + dfh['STD_SURFACE_EMISSIVITY'], color = hcolor, alpha = 0.5)
-    ax.fill_between(dfv['MEAN_RAD_FOOTPRINT_LATITUDE'], dfv['MEAN_SURFACE_EMISSIVITY'] - dfv['STD_SURFACE_EMISSIVITY'], dfv['MEAN_SURFACE_EMISSIVITY'] + dfv['STD_SURFACE_EMISSIVITY'], color = vcolor, alpha = 0.5)
-
-    dfv.plot.scatter('MEAN_RAD_FOOTPRINT_LATITUDE', 'MEAN_SURFACE_EMISSIVITY', ax=ax, s = 15, label="V-polarized",  marker = "x", color = vcoloravg)
-    dfh.plot.scatter('MEAN_RAD_FOOTPRINT_LATITUDE', 'MEAN_SURFACE_EMISSIVITY', ax=ax, s = 15, label="H-polarized",  marker = "x", color = hcoloravg)
+    for stats, color in ((stats_h, hcolor), (stats_v, vcolor)):
+        x = stats['mean_lat'].to_numpy()
+        m = stats['mean_emis'].to_numpy()
+        sd = stats['std_emis'].to_numpy()
+        ax.fill_between(x, m - sd, m + sd, color = color, alpha = 0.5, rasterized = True)
 
+    stats_v.plot.scatter('mean_lat', 'mean_emis', ax=ax, s = 15, label="V-polarized",  marker = "x", color = vcoloravg, rasterized = True)
+    stats_h.plot.scatter('mean_lat', 'mean_emis', ax=ax, s = 15, label="H-polarized",  marker = "x", color = hcoloravg, rasterized = True)
 
 
     ax.set_xlabel("Footprint center latitude", fontsize = 10)
@@ -147,10 +160,30 @@ def main():
     ax.yaxis.labelpad = 8
     ax.legend(fontsize = 10, loc = 2)
 
-    plt.grid(visible=True, which='major', axis='both', linewidth=0.5)
+    ax.grid(visible=True, which='major', axis='both', linewidth=0.5)
+
+
+def main():
+    args = cli()
 
-    plt.savefig(args.figFile, bbox_inches='tight')
-    plt.show()
-    
     
-main()
\ No newline at end of file
+    # Read data from gpkg and store in dataframe
+    columns = [args.emisField, args.latField, args.incField]
+    ovda_v = read_gpkg(args.Vfile, columns)
+    ovda_h = read_gpkg(args.Hfile, columns)
+
+    # plot the data
+    with matplotlib.rc_context({"font.sans-serif": "Arial", "font.family": "sans-serif"}):
+        fig, ax = plt.subplots(1,1)
+        fig.set_size_inches(16, 8)
+
+        plot_emissivity(ovda_h, ovda_v, args, ax)
+
+        plt.savefig(args.figFile, dpi=300, bbox_inches='tight')
+        if interactive_backend():
+            plt.show()
+
+
+if __name__ == "__main__":
+    use_batch_backend()
+    main()